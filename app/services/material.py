@@ -1,19 +1,157 @@
+import math
 import os
 import random
-from typing import List, Literal
-from urllib.parse import urlencode
-
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from itertools import cycle
+from typing import Callable, Dict, List, Literal, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import orjson
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from moviepy.video.io.VideoFileClip import VideoFileClip
 from PIL import Image
-import io
 
 from app.config import config
 from app.models.schema import MaterialInfo, VideoAspect, VideoConcatMode, MaterialType
 from app.utils import utils
 
-requested_count = 0
+# cfg_key -> (api keys, round-robin iterator over them)
+_KEY_POOLS = {}
+_KEY_LOCK = threading.Lock()
+# number of material files downloaded at the same time
+_DOWNLOAD_WORKERS = 6
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+# extra videos downloaded on top of the required ones, to make up for failed downloads
+_SPARE_VIDEO_COUNT = 3
+# image formats that are saved as downloaded, mapped to their file extension
+_IMAGE_EXTENSIONS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "BMP": "bmp"}
+
+
+def _create_session() -> requests.Session:
+    # share one keep-alive connection pool per host across all searches and downloads
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_SESSION = _create_session()
+_PEXELS_VIDEOS_URL = "https://api.pexels.com/videos/search"
+_PEXELS_IMAGES_URL = "https://api.pexels.com/v1/search"
+_PIXABAY_VIDEOS_URL = "https://pixabay.com/api/videos/"
+_PIXABAY_IMAGES_URL = "https://pixabay.com/api/"
+# search results are stable for hours, reuse them across tasks
+_API_CACHE_TTL = 6 * 60 * 60
+
+
+def _build_url(url_base: str, params: dict) -> str:
+    # empty params are left out, so they never end up in the url or the cache key
+    query = urlencode({k: v for k, v in params.items() if v is not None and v != ""})
+    return f"{url_base}?{query}"
+
+
+def _api_cache_path(query_url: str) -> str:
+    # leave the api key out of the cache key, so rotated keys share the same entry
+    parts = urlsplit(query_url)
+    query = [(k, v) for k, v in parse_qsl(parts.query) if k != "key"]
+    url_hash = utils.md5(parts._replace(query=urlencode(query)).geturl())
+    return os.path.join(utils.storage_dir("cache_api", create=True), f"{url_hash}.json")
+
+
+def _remove_file(file_path: str):
+    try:
+        os.remove(file_path)
+    except OSError:
+        pass
+
+
+def _purge_api_cache(cache_dir: str, ttl: int = _API_CACHE_TTL):
+    """Remove the expired entries, and temp files left by failed writes"""
+    now = time.time()
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime >= ttl:
+                    _remove_file(entry.path)
+            except OSError:
+                pass
+
+
+def _read_api_cache(query_url: str, ttl: int = _API_CACHE_TTL):
+    """Return the cached json response of a search api url, None if missing or expired"""
+    cache_path = _api_cache_path(query_url)
+    try:
+        age = time.time() - os.path.getmtime(cache_path)
+    except OSError:
+        return None
+
+    if age >= ttl:
+        # expired, remove it so stale entries do not pile up
+        _remove_file(cache_path)
+        return None
+
+    try:
+        with open(cache_path, "rb") as f:
+            response = orjson.loads(f.read())
+        logger.info(f"using cached search results: {cache_path}")
+        return response
+    except Exception as e:
+        logger.warning(f"invalid search cache: {cache_path} => {str(e)}")
+        _remove_file(cache_path)
+    return None
+
+
+def _write_api_cache(query_url: str, content: bytes, ttl: int = _API_CACHE_TTL):
+    cache_path = _api_cache_path(query_url)
+    # write to a temp file first, so concurrent searches never read a partial file
+    tmp_path = f"{cache_path}.{utils.get_uuid(True)}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+    finally:
+        if os.path.exists(tmp_path):
+            _remove_file(tmp_path)
+
+    # entries of searches that are never repeated would otherwise stay forever
+    _purge_api_cache(os.path.dirname(cache_path), ttl)
+
+
+def _cached_get(query_url: str, headers: dict = None, ttl: int = _API_CACHE_TTL):
+    """GET a search api url, caching the json response on disk for ttl seconds"""
+    response = _read_api_cache(query_url, ttl)
+    if response is not None:
+        return response
+
+    r = _SESSION.get(
+        query_url,
+        headers=headers,
+        proxies=config.proxy,
+        verify=False,
+        timeout=(30, 60),
+    )
+    r.raise_for_status()
+    response = orjson.loads(r.content)
+    try:
+        _write_api_cache(query_url, r.content, ttl)
+    except Exception as e:
+        # the search itself succeeded, a cache failure must not fail it
+        logger.warning(f"failed to write search cache: {query_url} => {str(e)}")
+    return response
 
 
 def get_api_key(cfg_key: str):
@@ -28,19 +166,22 @@ def get_api_key(cfg_key: str):
     if isinstance(api_keys, str):
         return api_keys
 
-    global requested_count
-    requested_count += 1
-    return api_keys[requested_count % len(api_keys)]
+    # rotate the keys round-robin, the lock keeps it safe for the concurrent searches
+    keys = tuple(str(k) for k in api_keys)
+    with _KEY_LOCK:
+        pool = _KEY_POOLS.get(cfg_key)
+        # the keys can be changed at runtime from the webui, rebuild the pool then
+        if pool is None or pool[0] != keys:
+            pool = (keys, cycle(keys))
+            _KEY_POOLS[cfg_key] = pool
+        return next(pool[1])
 
 
-def search_videos_pexels(
-    search_term: str,
-    minimum_duration: int,
-    video_aspect: VideoAspect = VideoAspect.portrait,
-) -> List[MaterialInfo]:
+def _pexels_video_query(
+    search_term: str, video_aspect: VideoAspect = VideoAspect.portrait
+) -> Tuple[str, dict]:
     aspect = VideoAspect(video_aspect)
     video_orientation = aspect.name
-    video_width, video_height = aspect.to_resolution()
     api_key = get_api_key("pexels_api_keys")
     headers = {
         "Authorization": api_key,
@@ -48,43 +189,103 @@ def search_videos_pexels(
     }
     # Build URL
     params = {"query": search_term, "per_page": 20, "orientation": video_orientation}
-    query_url = f"https://api.pexels.com/videos/search?{urlencode(params)}"
+    query_url = _build_url(_PEXELS_VIDEOS_URL, params)
+    return query_url, headers
+
+
+def _parse_pexels_videos(
+    response: dict,
+    minimum_duration: int,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+) -> List[MaterialInfo]:
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    video_items = []
+    if "videos" not in response:
+        logger.error(f"search videos failed: {response}")
+        return video_items
+    videos = response["videos"]
+    # loop through each video in the result
+    for v in videos:
+        duration = v["duration"]
+        # check if video has desired minimum duration
+        if duration < minimum_duration:
+            continue
+        video_files = v["video_files"]
+        # loop through each url to determine the best quality
+        for video in video_files:
+            w = int(video["width"])
+            h = int(video["height"])
+            if w == video_width and h == video_height:
+                item = MaterialInfo()
+                item.provider = "pexels"
+                item.url = video["link"]
+                item.duration = duration
+                item.type = MaterialType.video
+                video_items.append(item)
+                break
+    return video_items
+
+
+def _pixabay_video_query(
+    search_term: str, video_aspect: VideoAspect = VideoAspect.portrait
+) -> Tuple[str, dict]:
+    api_key = get_api_key("pixabay_api_keys")
+    # Build URL
+    params = {
+        "q": search_term,
+        "video_type": "all",  # Accepted values: "all", "film", "animation"
+        "per_page": 50,
+        "key": api_key,
+    }
+    query_url = _build_url(_PIXABAY_VIDEOS_URL, params)
+    return query_url, {}
+
+
+def _parse_pixabay_videos(
+    response: dict,
+    minimum_duration: int,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+) -> List[MaterialInfo]:
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    video_items = []
+    if "hits" not in response:
+        logger.error(f"search videos failed: {response}")
+        return video_items
+    videos = response["hits"]
+    # loop through each video in the result
+    for v in videos:
+        duration = v["duration"]
+        # check if video has desired minimum duration
+        if duration < minimum_duration:
+            continue
+        video_files = v["videos"]
+        # loop through each url to determine the best quality
+        for video_type in video_files:
+            video = video_files[video_type]
+            w = int(video["width"])
+            # h = int(video["height"])
+            if w >= video_width:
+                item = MaterialInfo()
+                item.provider = "pixabay"
+                item.url = video["url"]
+                item.duration = duration
+                item.type = MaterialType.video
+                video_items.append(item)
+                break
+    return video_items
+
+
+def search_videos_pexels(
+    search_term: str,
+    minimum_duration: int,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+) -> List[MaterialInfo]:
+    query_url, headers = _pexels_video_query(search_term, video_aspect)
     logger.info(f"searching videos: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
-            query_url,
-            headers=headers,
-            proxies=config.proxy,
-            verify=False,
-            timeout=(30, 60),
-        )
-        response = r.json()
-        video_items = []
-        if "videos" not in response:
-            logger.error(f"search videos failed: {response}")
-            return video_items
-        videos = response["videos"]
-        # loop through each video in the result
-        for v in videos:
-            duration = v["duration"]
-            # check if video has desired minimum duration
-            if duration < minimum_duration:
-                continue
-            video_files = v["video_files"]
-            # loop through each url to determine the best quality
-            for video in video_files:
-                w = int(video["width"])
-                h = int(video["height"])
-                if w == video_width and h == video_height:
-                    item = MaterialInfo()
-                    item.provider = "pexels"
-                    item.url = video["link"]
-                    item.duration = duration
-                    item.type = MaterialType.video
-                    video_items.append(item)
-                    break
-        return video_items
+        response = _cached_get(query_url, headers=headers)
+        return _parse_pexels_videos(response, minimum_duration, video_aspect)
     except Exception as e:
         logger.error(f"search videos failed: {str(e)}")
 
@@ -96,52 +297,12 @@ def search_videos_pixabay(
     minimum_duration: int,
     video_aspect: VideoAspect = VideoAspect.portrait,
 ) -> List[MaterialInfo]:
-    aspect = VideoAspect(video_aspect)
-
-    video_width, video_height = aspect.to_resolution()
-
-    api_key = get_api_key("pixabay_api_keys")
-    # Build URL
-    params = {
-        "q": search_term,
-        "video_type": "all",  # Accepted values: "all", "film", "animation"
-        "per_page": 50,
-        "key": api_key,
-    }
-    query_url = f"https://pixabay.com/api/videos/?{urlencode(params)}"
+    query_url, headers = _pixabay_video_query(search_term, video_aspect)
     logger.info(f"searching videos: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
-            query_url, proxies=config.proxy, verify=False, timeout=(30, 60)
-        )
-        response = r.json()
-        video_items = []
-        if "hits" not in response:
-            logger.error(f"search videos failed: {response}")
-            return video_items
-        videos = response["hits"]
-        # loop through each video in the result
-        for v in videos:
-            duration = v["duration"]
-            # check if video has desired minimum duration
-            if duration < minimum_duration:
-                continue
-            video_files = v["videos"]
-            # loop through each url to determine the best quality
-            for video_type in video_files:
-                video = video_files[video_type]
-                w = int(video["width"])
-                # h = int(video["height"])
-                if w >= video_width:
-                    item = MaterialInfo()
-                    item.provider = "pixabay"
-                    item.url = video["url"]
-                    item.duration = duration
-                    item.type = MaterialType.video
-                    video_items.append(item)
-                    break
-        return video_items
+        response = _cached_get(query_url, headers=headers)
+        return _parse_pixabay_videos(response, minimum_duration, video_aspect)
     except Exception as e:
         logger.error(f"search videos failed: {str(e)}")
 
@@ -164,18 +325,11 @@ def search_images_pexels(
     
     # Build URL
     params = {"query": search_term, "per_page": per_page, "orientation": image_orientation}
-    query_url = f"https://api.pexels.com/v1/search?{urlencode(params)}"
+    query_url = _build_url(_PEXELS_IMAGES_URL, params)
     logger.info(f"searching images: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
-            query_url,
-            headers=headers,
-            proxies=config.proxy,
-            verify=False,
-            timeout=(30, 60),
-        )
-        response = r.json()
+        response = _cached_get(query_url, headers=headers)
         image_items = []
         if "photos" not in response:
             logger.error(f"search images failed: {response}")
@@ -226,14 +380,11 @@ def search_images_pixabay(
     elif image_type == "photo":
         params["image_type"] = "photo"
     
-    query_url = f"https://pixabay.com/api/?{urlencode(params)}"
+    query_url = _build_url(_PIXABAY_IMAGES_URL, params)
     logger.info(f"searching images: {query_url}, with proxies: {config.proxy}")
 
     try:
-        r = requests.get(
-            query_url, proxies=config.proxy, verify=False, timeout=(30, 60)
-        )
-        response = r.json()
+        response = _cached_get(query_url)
         image_items = []
         if "hits" not in response:
             logger.error(f"search images failed: {response}")
@@ -257,17 +408,175 @@ def search_images_pixabay(
     return []
 
 
-def save_video(video_url: str, save_dir: str = "") -> str:
+def _content_length(url: str, headers: dict = None, timeout=(60, 240)) -> int:
+    """Ask the server for the size of a file, 0 if it is unknown"""
+    try:
+        r = _SESSION.head(
+            url,
+            headers=headers,
+            proxies=config.proxy,
+            verify=False,
+            timeout=timeout,
+            allow_redirects=True,
+        )
+        r.raise_for_status()
+        return int(r.headers.get("Content-Length", 0))
+    except Exception as e:
+        logger.warning(f"failed to get content length: {url} => {str(e)}")
+        return 0
+
+
+def _download_file(
+    url: str,
+    file_path: str,
+    headers: dict = None,
+    timeout=(60, 240),
+    resume: bool = False,
+):
+    """Stream a url to disk chunk by chunk, without holding the whole body in memory.
+
+    With resume, a partial file left by an interrupted download is completed
+    with a range request instead of being downloaded again from scratch.
+    """
+    headers = dict(headers or {})
+    existing = os.path.getsize(file_path) if resume and os.path.exists(file_path) else 0
+    if existing > 0:
+        expected = _content_length(url, headers=headers, timeout=timeout)
+        if existing == expected:
+            logger.info(f"download already completed: {file_path}")
+            return
+        if not expected or existing < expected:
+            logger.info(f"resuming download from {existing} bytes: {file_path}")
+            headers["Range"] = f"bytes={existing}-"
+
+    with _SESSION.get(
+        url,
+        headers=headers,
+        proxies=config.proxy,
+        verify=False,
+        timeout=timeout,
+        stream=True,
+    ) as r:
+        if r.status_code == 416 and "Range" in headers:
+            # the partial file does not match the remote file, start over
+            os.remove(file_path)
+            headers.pop("Range")
+            return _download_file(url, file_path, headers=headers, timeout=timeout)
+
+        r.raise_for_status()
+        # 206 continues the partial file, 200 means the server ignored the range
+        mode = "ab" if r.status_code == 206 else "wb"
+        with open(file_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+
+@lru_cache(maxsize=1)
+def _ffprobe_binary() -> str:
+    # prefer the ffprobe shipped next to the configured ffmpeg
+    ffmpeg_path = os.environ.get("IMAGEIO_FFMPEG_EXE", "")
+    if ffmpeg_path:
+        ffprobe_name = "ffprobe.exe" if os.name == "nt" else "ffprobe"
+        ffprobe_path = os.path.join(os.path.dirname(ffmpeg_path), ffprobe_name)
+        if os.path.isfile(ffprobe_path):
+            return ffprobe_path
+    return shutil.which("ffprobe") or ""
+
+
+def _probe(video_path: str) -> Tuple[float, float]:
+    """Read the duration and fps of a video, using ffprobe when it is available"""
+    ffprobe = _ffprobe_binary()
+    if not ffprobe:
+        clip = VideoFileClip(video_path)
+        try:
+            return clip.duration, clip.fps
+        finally:
+            clip.close()
+
+    result = subprocess.run(
+        [
+            ffprobe,
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            video_path,
+        ],
+        capture_output=True,
+        timeout=10,
+        check=True,
+    )
+    info = orjson.loads(result.stdout)
+    duration = float(info["format"]["duration"])
+    streams = info.get("streams") or []
+    if not streams:
+        return duration, 0.0
+
+    # r_frame_rate is a fraction, e.g. "30000/1001"
+    num, _, den = streams[0].get("r_frame_rate", "0/1").partition("/")
+    fps = float(num) / float(den) if den and float(den) else float(num)
+    return duration, fps
+
+
+def material_save_dir(save_dir: str = "", material_type: MaterialType = MaterialType.video) -> str:
     if not save_dir:
-        save_dir = utils.storage_dir("cache_videos")
+        save_dir = utils.storage_dir("cache_videos" if material_type == MaterialType.video else "images")
 
     if not os.path.exists(save_dir):
         os.makedirs(save_dir)
+    return save_dir
 
-    url_without_query = video_url.split("?")[0]
+
+def material_id(material_url: str, material_type: MaterialType = MaterialType.video) -> str:
+    """File name of a downloaded material, without its extension"""
+    # the same asset can be linked with different query strings or fragments
+    url_without_query = urlsplit(material_url)._replace(query="", fragment="").geturl()
     url_hash = utils.md5(url_without_query)
-    video_id = f"vid-{url_hash}"
-    video_path = f"{save_dir}/{video_id}.mp4"
+    prefix = "vid" if material_type == MaterialType.video else "img"
+    return f"{prefix}-{url_hash}"
+
+
+def list_existing_materials(save_dir: str) -> Dict[str, str]:
+    """Map the id of every material already downloaded to save_dir to its path, in one directory scan"""
+    extensions = {"mp4", *_IMAGE_EXTENSIONS.values()}
+    existing = {}
+    with os.scandir(save_dir) as entries:
+        for entry in entries:
+            file_id, ext = os.path.splitext(entry.name)
+            if ext.lstrip(".") not in extensions:
+                continue
+            if entry.is_file() and entry.stat().st_size > 0:
+                existing[file_id] = f"{save_dir}/{entry.name}"
+    return existing
+
+
+def _validate_video(video_path: str) -> str:
+    """Return the path if the downloaded video is playable, remove it otherwise"""
+    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
+        try:
+            duration, fps = _probe(video_path)
+            if duration > 0 and fps > 0:
+                return video_path
+            reason = f"duration: {duration}, fps: {fps}"
+        except Exception as e:
+            reason = str(e)
+
+        # a file left at the final path is taken as downloaded, so never keep an invalid one
+        try:
+            os.remove(video_path)
+        except Exception:
+            pass
+        logger.warning(f"invalid video file: {video_path} => {reason}")
+    return ""
+
+
+def save_video(video_url: str, save_dir: str = "") -> str:
+    save_dir = material_save_dir(save_dir, MaterialType.video)
+    video_path = f"{save_dir}/{material_id(video_url, MaterialType.video)}.mp4"
 
     # if video already exists, return the path
     if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
@@ -278,79 +587,60 @@ def save_video(video_url: str, save_dir: str = "") -> str:
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
     }
 
-    # if video does not exist, download it
-    with open(video_path, "wb") as f:
-        f.write(
-            requests.get(
-                video_url,
-                headers=headers,
-                proxies=config.proxy,
-                verify=False,
-                timeout=(60, 240),
-            ).content
-        )
-
-    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
-        try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
-            if duration > 0 and fps > 0:
-                return video_path
-        except Exception as e:
-            try:
-                os.remove(video_path)
-            except Exception:
-                pass
-            logger.warning(f"invalid video file: {video_path} => {str(e)}")
-    return ""
+    # if video does not exist, download it, an interrupted download is kept as .part and resumed next time
+    part_path = f"{video_path}.part"
+    _download_file(video_url, part_path, headers=headers, timeout=(60, 240), resume=True)
+    os.replace(part_path, video_path)
+    return _validate_video(video_path)
 
 
 def save_image(image_url: str, save_dir: str = ""):
     """Save an image to disk"""
-    if not save_dir:
-        save_dir = utils.storage_dir("images")
-
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-
-    url_without_query = image_url.split("?")[0]
-    url_hash = utils.md5(url_without_query)
-    image_id = f"img-{url_hash}"
-    image_path = f"{save_dir}/{image_id}.jpg"
+    save_dir = material_save_dir(save_dir, MaterialType.image)
+    image_id = material_id(image_url, MaterialType.image)
 
     # if image already exists, return the path
-    if os.path.exists(image_path) and os.path.getsize(image_path) > 0:
-        logger.info(f"image already exists: {image_path}")
-        return image_path
+    for ext in dict.fromkeys(_IMAGE_EXTENSIONS.values()):
+        image_path = f"{save_dir}/{image_id}.{ext}"
+        if os.path.exists(image_path) and os.path.getsize(image_path) > 0:
+            logger.info(f"image already exists: {image_path}")
+            return image_path
 
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36"
     }
 
     # if image does not exist, download it
+    part_path = f"{save_dir}/{image_id}.part"
+    image_path = f"{save_dir}/{image_id}.jpg"
     try:
-        response = requests.get(
-            image_url,
-            headers=headers,
-            proxies=config.proxy,
-            verify=False,
-            timeout=(30, 60),
-        )
-        
-        if response.status_code == 200:
-            # Verify it's a valid image
-            try:
-                img = Image.open(io.BytesIO(response.content))
-                img.save(image_path)
-                return image_path
-            except Exception as e:
-                logger.warning(f"invalid image file: {image_path} => {str(e)}")
-                return ""
+        _download_file(image_url, part_path, headers=headers, timeout=(30, 60))
+
+        # Verify it's a valid image, only the file structure is checked, nothing is decoded
+        try:
+            with Image.open(part_path) as img:
+                img.verify()
+                image_format = img.format
+
+            ext = _IMAGE_EXTENSIONS.get(image_format)
+            if ext:
+                # keep the original bytes, no need to re-encode
+                image_path = f"{save_dir}/{image_id}.{ext}"
+                os.replace(part_path, image_path)
+            else:
+                # other formats are converted to jpg, as before
+                with Image.open(part_path) as img:
+                    img.convert("RGB").save(image_path)
+            return image_path
+        except Exception as e:
+            logger.warning(f"invalid image file: {image_path} => {str(e)}")
+            return ""
     except Exception as e:
         logger.error(f"failed to download image: {image_url} => {str(e)}")
-        
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
     return ""
 
 
@@ -362,6 +652,33 @@ def save_material(material_url: str, save_dir: str = "", material_type: Material
         return save_image(material_url, save_dir)
 
 
+def get_material_directory(task_id: str) -> str:
+    material_directory = config.app.get("material_directory", "").strip()
+    if material_directory == "task":
+        material_directory = utils.task_dir(task_id)
+    elif material_directory and not os.path.isdir(material_directory):
+        material_directory = ""
+    return material_directory
+
+
+def search_materials(
+    search_func: Callable[..., List[MaterialInfo]],
+    search_terms: List[str],
+    **kwargs,
+) -> List[List[MaterialInfo]]:
+    """Run the searches concurrently, returning the results in search term order"""
+    if not search_terms:
+        return []
+
+    max_workers = min(8, len(search_terms))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(search_func, search_term=search_term, **kwargs)
+            for search_term in search_terms
+        ]
+        return [future.result() for future in futures]
+
+
 def download_materials(
     task_id: str,
     search_terms: List[str],
@@ -396,6 +713,50 @@ def download_materials(
         )
 
 
+def search_unique_materials(
+    search_func: Callable[..., List[MaterialInfo]],
+    search_terms: List[str],
+    **kwargs,
+) -> List[MaterialInfo]:
+    """Search all the terms concurrently and merge the results, keeping one item per material file"""
+    valid_items = []
+    valid_ids: Set[str] = set()
+    results = search_materials(search_func, search_terms, **kwargs)
+    for search_term, items in zip(search_terms, results):
+        logger.info(f"found {len(items)} materials for '{search_term}'")
+
+        for item in items:
+            # dedup on the file id, links that only differ by query or fragment share one file
+            item_id = material_id(item.url, item.type)
+            if item_id not in valid_ids:
+                valid_items.append(item)
+                valid_ids.add(item_id)
+    return valid_items
+
+
+def _submit_save(
+    executor: ThreadPoolExecutor,
+    item: MaterialInfo,
+    save_dir: str,
+    existing_materials: Dict[str, str],
+) -> Future:
+    """Schedule the download of a material, a material already on disk resolves right away"""
+    existing_path = existing_materials.get(material_id(item.url, item.type))
+    if existing_path:
+        logger.info(f"{item.type.value} already exists: {existing_path}")
+        future = Future()
+        future.set_result(existing_path)
+        return future
+
+    logger.info(f"downloading {item.type.value}: {item.url}")
+    return executor.submit(
+        save_material,
+        material_url=item.url,
+        save_dir=save_dir,
+        material_type=item.type,
+    )
+
+
 def download_images(
     task_id: str,
     search_terms: List[str],
@@ -405,52 +766,44 @@ def download_images(
     image_type: str = "all",
 ) -> List[str]:
     """Download images based on search terms"""
-    valid_image_items = []
-    valid_image_urls = []
     search_images = search_images_pexels
     if source == "pixabay":
         search_images = search_images_pixabay
 
-    for search_term in search_terms:
-        image_items = search_images(
-            search_term=search_term,
-            image_aspect=image_aspect,
-            image_type=image_type,
-        )
-        logger.info(f"found {len(image_items)} images for '{search_term}'")
-
-        for item in image_items:
-            if item.url not in valid_image_urls:
-                valid_image_items.append(item)
-                valid_image_urls.append(item.url)
-
+    valid_image_items = search_unique_materials(
+        search_images,
+        search_terms,
+        image_aspect=image_aspect,
+        image_type=image_type,
+    )
     logger.info(f"found total images: {len(valid_image_items)}")
     image_paths = []
 
-    material_directory = config.app.get("material_directory", "").strip()
-    if material_directory == "task":
-        material_directory = utils.task_dir(task_id)
-    elif material_directory and not os.path.isdir(material_directory):
-        material_directory = ""
+    material_directory = material_save_dir(get_material_directory(task_id), MaterialType.image)
+    # scan the directory once, instead of checking every candidate file on its own
+    existing_materials = list_existing_materials(material_directory)
 
     # Shuffle the images to get a good mix
     random.shuffle(valid_image_items)
 
     # Limit to the requested number of images
     count = min(image_count, len(valid_image_items))
-    for i in range(count):
-        item = valid_image_items[i]
-        try:
-            logger.info(f"downloading image: {item.url}")
-            saved_image_path = save_material(
-                material_url=item.url, save_dir=material_directory, material_type=item.type
-            )
-            if saved_image_path:
-                logger.info(f"image saved: {saved_image_path}")
-                image_paths.append(saved_image_path)
-        except Exception as e:
-            logger.error(f"failed to download image: {utils.to_json(item)} => {str(e)}")
-    
+    with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as executor:
+        futures = {
+            _submit_save(executor, item, material_directory, existing_materials): item
+            for item in valid_image_items[:count]
+        }
+
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                saved_image_path = future.result()
+                if saved_image_path:
+                    logger.info(f"image saved: {saved_image_path}")
+                    image_paths.append(saved_image_path)
+            except Exception as e:
+                logger.error(f"failed to download image: {utils.to_json(item)} => {str(e)}")
+
     logger.success(f"downloaded {len(image_paths)} images")
     return image_paths
 
@@ -464,60 +817,62 @@ def download_videos(
     audio_duration: float = 0.0,
     max_clip_duration: int = 5,
 ) -> List[str]:
-    valid_video_items = []
-    valid_video_urls = []
-    found_duration = 0.0
     search_videos = search_videos_pexels
     if source == "pixabay":
         search_videos = search_videos_pixabay
 
-    for search_term in search_terms:
-        video_items = search_videos(
-            search_term=search_term,
-            minimum_duration=max_clip_duration,
-            video_aspect=video_aspect,
-        )
-        logger.info(f"found {len(video_items)} videos for '{search_term}'")
-
-        for item in video_items:
-            if item.url not in valid_video_urls:
-                valid_video_items.append(item)
-                valid_video_urls.append(item.url)
-                found_duration += item.duration
-
+    valid_video_items = search_unique_materials(
+        search_videos,
+        search_terms,
+        minimum_duration=max_clip_duration,
+        video_aspect=video_aspect,
+    )
+    found_duration = sum(item.duration for item in valid_video_items)
     logger.info(
         f"found total videos: {len(valid_video_items)}, required duration: {audio_duration} seconds, found duration: {found_duration} seconds"
     )
     video_paths = []
 
-    material_directory = config.app.get("material_directory", "").strip()
-    if material_directory == "task":
-        material_directory = utils.task_dir(task_id)
-    elif material_directory and not os.path.isdir(material_directory):
-        material_directory = ""
+    material_directory = material_save_dir(get_material_directory(task_id), MaterialType.video)
+    # scan the directory once, instead of checking every candidate file on its own
+    existing_materials = list_existing_materials(material_directory)
 
     if video_contact_mode.value == VideoConcatMode.random.value:
         random.shuffle(valid_video_items)
 
     total_duration = 0.0
-    for item in valid_video_items:
-        try:
-            logger.info(f"downloading video: {item.url}")
-            saved_video_path = save_material(
-                material_url=item.url, save_dir=material_directory, material_type=item.type
-            )
-            if saved_video_path:
-                logger.info(f"video saved: {saved_video_path}")
-                video_paths.append(saved_video_path)
-                seconds = min(max_clip_duration, item.duration)
-                total_duration += seconds
-                if total_duration > audio_duration:
-                    logger.info(
-                        f"total duration of downloaded videos: {total_duration} seconds, skip downloading more"
-                    )
-                    break
-        except Exception as e:
-            logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
+    candidates = valid_video_items
+    executor = ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS)
+    try:
+        while candidates and total_duration <= audio_duration:
+            # only download the clips still needed to cover the audio, plus a few spare ones
+            remaining = audio_duration - total_duration
+            needed = math.ceil(remaining / max(max_clip_duration, 1)) + _SPARE_VIDEO_COUNT
+            batch, candidates = candidates[:needed], candidates[needed:]
+            futures = [
+                _submit_save(executor, item, material_directory, existing_materials)
+                for item in batch
+            ]
+
+            # collect in submission order so the sequential concat mode keeps its order
+            for item, future in zip(batch, futures):
+                try:
+                    saved_video_path = future.result()
+                    if saved_video_path:
+                        logger.info(f"video saved: {saved_video_path}")
+                        video_paths.append(saved_video_path)
+                        seconds = min(max_clip_duration, item.duration)
+                        total_duration += seconds
+                        if total_duration > audio_duration:
+                            logger.info(
+                                f"total duration of downloaded videos: {total_duration} seconds, skip downloading more"
+                            )
+                            break
+                except Exception as e:
+                    logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
+    finally:
+        # drop the downloads that have not started yet, wait for the running ones
+        executor.shutdown(wait=True, cancel_futures=True)
     logger.success(f"downloaded {len(video_paths)} videos")
     return video_paths
 
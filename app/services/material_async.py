@@ -0,0 +1,27 @@
+import asyncio
+from typing import List
+
+from app.models.schema import VideoAspect, VideoConcatMode
+from app.services import material
+
+
+async def adownload_videos(
+    task_id: str,
+    search_terms: List[str],
+    source: str = "pexels",
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    video_contact_mode: VideoConcatMode = VideoConcatMode.random,
+    audio_duration: float = 0.0,
+    max_clip_duration: int = 5,
+) -> List[str]:
+    """Download videos from async code, the download itself runs on material's thread pool"""
+    return await asyncio.to_thread(
+        material.download_videos,
+        task_id=task_id,
+        search_terms=search_terms,
+        source=source,
+        video_aspect=video_aspect,
+        video_contact_mode=video_contact_mode,
+        audio_duration=audio_duration,
+        max_clip_duration=max_clip_duration,
+    )
@@ -0,0 +1,467 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+# add project root to python path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+from app.models.schema import MaterialInfo, MaterialType, VideoConcatMode
+from app.services import material, material_async
+
+
+def mock_response(status_code: int = 200, content: bytes = b"", headers: dict = None):
+    response = mock.MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.iter_content.return_value = [content]
+    response.__enter__.return_value = response
+    response.__exit__.return_value = False
+    return response
+
+
+class TestDownloadFile(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.temp_dir.name, "vid-test.mp4.part")
+        patcher = mock.patch.object(material, "_SESSION")
+        self.session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_part(self, content: bytes):
+        with open(self.file_path, "wb") as f:
+            f.write(content)
+
+    def read_part(self) -> bytes:
+        with open(self.file_path, "rb") as f:
+            return f.read()
+
+    def test_download_new_file(self):
+        self.session.get.return_value = mock_response(200, b"abcdef")
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        self.assertEqual(self.read_part(), b"abcdef")
+        self.session.head.assert_not_called()
+        self.assertNotIn("Range", self.session.get.call_args.kwargs["headers"])
+
+    def test_resume_smaller_part(self):
+        self.write_part(b"abc")
+        self.session.head.return_value = mock_response(200, headers={"Content-Length": "6"})
+        self.session.get.return_value = mock_response(206, b"def")
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        self.assertEqual(self.read_part(), b"abcdef")
+        self.assertEqual(self.session.get.call_args.kwargs["headers"]["Range"], "bytes=3-")
+
+    def test_resume_ignored_by_server(self):
+        self.write_part(b"abc")
+        self.session.head.return_value = mock_response(200, headers={"Content-Length": "6"})
+        self.session.get.return_value = mock_response(200, b"abcdef")
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        # a 200 reply holds the whole file, so the part file is rewritten
+        self.assertEqual(self.read_part(), b"abcdef")
+
+    def test_part_equal_to_content_length(self):
+        self.write_part(b"abcdef")
+        self.session.head.return_value = mock_response(200, headers={"Content-Length": "6"})
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        self.assertEqual(self.read_part(), b"abcdef")
+        self.session.get.assert_not_called()
+
+    def test_part_larger_than_content_length(self):
+        self.write_part(b"abcdefgh")
+        self.session.head.return_value = mock_response(200, headers={"Content-Length": "6"})
+        self.session.get.return_value = mock_response(200, b"abcdef")
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        self.assertEqual(self.read_part(), b"abcdef")
+        self.assertNotIn("Range", self.session.get.call_args.kwargs["headers"])
+
+    def test_range_not_satisfiable_restarts(self):
+        self.write_part(b"abc")
+        self.session.head.return_value = mock_response(200, headers={"Content-Length": "6"})
+        self.session.get.side_effect = [
+            mock_response(416),
+            mock_response(200, b"abcdef"),
+        ]
+
+        material._download_file("https://example.com/a.mp4", self.file_path, resume=True)
+
+        self.assertEqual(self.read_part(), b"abcdef")
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertNotIn("Range", self.session.get.call_args.kwargs["headers"])
+
+
+class TestApiCache(unittest.TestCase):
+    url = "https://pixabay.com/api/videos/?q=money&per_page=50"
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        storage_patcher = mock.patch.object(
+            material.utils, "storage_dir", return_value=self.temp_dir.name
+        )
+        storage_patcher.start()
+        self.addCleanup(storage_patcher.stop)
+        session_patcher = mock.patch.object(material, "_SESSION")
+        self.session = session_patcher.start()
+        self.addCleanup(session_patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def expire(self, file_path: str):
+        expired = time.time() - material._API_CACHE_TTL - 60
+        os.utime(file_path, (expired, expired))
+
+    def test_api_cache_path_ignores_key(self):
+        self.assertEqual(
+            material._api_cache_path(f"{self.url}&key=first"),
+            material._api_cache_path(f"{self.url}&key=second"),
+        )
+        self.assertNotEqual(
+            material._api_cache_path(self.url),
+            material._api_cache_path("https://pixabay.com/api/videos/?q=exchange&per_page=50"),
+        )
+
+    def test_fresh_entry_skips_request(self):
+        material._write_api_cache(self.url, b'{"hits": [1]}')
+
+        self.assertEqual(material._cached_get(self.url), {"hits": [1]})
+        self.session.get.assert_not_called()
+
+    def test_expired_entry_refetches(self):
+        material._write_api_cache(self.url, b'{"hits": [1]}')
+        self.expire(material._api_cache_path(self.url))
+        self.session.get.return_value = mock_response(200, b'{"hits": [2]}')
+        self.session.get.return_value.content = b'{"hits": [2]}'
+
+        self.assertEqual(material._cached_get(self.url), {"hits": [2]})
+        self.session.get.assert_called_once()
+        # the refreshed response is cached again
+        self.assertEqual(material._read_api_cache(self.url), {"hits": [2]})
+
+    def test_expired_entries_removed(self):
+        other_url = "https://pixabay.com/api/videos/?q=exchange&per_page=50"
+        material._write_api_cache(other_url, b'{"hits": []}')
+        other_path = material._api_cache_path(other_url)
+        self.expire(other_path)
+
+        self.assertIsNone(material._read_api_cache(other_url))
+        self.assertFalse(os.path.exists(other_path))
+
+        # entries that are never read again are purged by the next write
+        material._write_api_cache(other_url, b'{"hits": []}')
+        self.expire(other_path)
+        material._write_api_cache(self.url, b'{"hits": [1]}')
+        self.assertFalse(os.path.exists(other_path))
+        self.assertTrue(os.path.exists(material._api_cache_path(self.url)))
+
+    def test_failed_write_leaves_no_tmp_file(self):
+        with mock.patch.object(material.os, "replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                material._write_api_cache(self.url, b'{"hits": [1]}')
+
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+class TestProbe(unittest.TestCase):
+    def probe(self, r_frame_rate: str, duration: str = "12.5"):
+        info = {
+            "streams": [{"codec_type": "video", "r_frame_rate": r_frame_rate}],
+            "format": {"duration": duration},
+        }
+        result = mock.MagicMock(stdout=json.dumps(info).encode("utf-8"))
+        with mock.patch.object(material, "_ffprobe_binary", return_value="ffprobe"), \
+                mock.patch.object(material.subprocess, "run", return_value=result):
+            return material._probe("video.mp4")
+
+    def test_probe_fraction_frame_rate(self):
+        duration, fps = self.probe("30000/1001")
+        self.assertEqual(duration, 12.5)
+        self.assertAlmostEqual(fps, 29.97, places=2)
+
+    def test_probe_integer_frame_rate(self):
+        _, fps = self.probe("25/1")
+        self.assertEqual(fps, 25.0)
+
+    def test_probe_zero_frame_rate(self):
+        _, fps = self.probe("0/0")
+        self.assertEqual(fps, 0.0)
+
+    def test_invalid_video_removed(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            video_path = os.path.join(temp_dir, "vid-test.mp4")
+            with open(video_path, "wb") as f:
+                f.write(b"not a video")
+
+            with mock.patch.object(material, "_probe", return_value=(12.5, 0.0)):
+                self.assertEqual(material._validate_video(video_path), "")
+            self.assertFalse(os.path.exists(video_path))
+
+
+class TestGetApiKey(unittest.TestCase):
+    def setUp(self):
+        material._KEY_POOLS.clear()
+        self.addCleanup(material._KEY_POOLS.clear)
+
+    def get_keys(self, api_keys, count: int) -> list:
+        with mock.patch.dict(material.config.app, {"pexels_api_keys": api_keys}):
+            return [material.get_api_key("pexels_api_keys") for _ in range(count)]
+
+    def test_keys_rotate(self):
+        self.assertEqual(self.get_keys(["a", "b", "c"], 4), ["a", "b", "c", "a"])
+
+    def test_pool_rebuilt_when_keys_change(self):
+        self.assertEqual(self.get_keys(["a", "b", "c"], 2), ["a", "b"])
+        self.assertEqual(self.get_keys(["x", "y"], 3), ["x", "y", "x"])
+
+    def test_single_key(self):
+        self.assertEqual(self.get_keys("a", 2), ["a", "a"])
+
+    def test_missing_key(self):
+        for api_keys in [None, "", []]:
+            with self.subTest(api_keys=api_keys):
+                with self.assertRaises(ValueError):
+                    self.get_keys(api_keys, 1)
+
+
+class TestMaterialId(unittest.TestCase):
+    def test_query_and_fragment_ignored(self):
+        url = "https://videos.pexels.com/video-files/1/1-hd_1080_1920_25fps.mp4"
+        self.assertEqual(
+            material.material_id(url),
+            material.material_id(f"{url}?token=abc&expires=1#t=5"),
+        )
+        self.assertNotEqual(
+            material.material_id(url),
+            material.material_id(url.replace("/1/1-", "/2/2-")),
+        )
+
+    def test_prefix(self):
+        url = "https://images.pexels.com/photos/1/photo.jpeg"
+        self.assertTrue(material.material_id(url, MaterialType.video).startswith("vid-"))
+        self.assertTrue(material.material_id(url, MaterialType.image).startswith("img-"))
+
+
+def video_items(count: int, duration: int = 10) -> list:
+    items = []
+    for i in range(count):
+        item = MaterialInfo()
+        item.url = f"https://videos.pexels.com/video-files/{i}/{i}.mp4"
+        item.duration = duration
+        items.append(item)
+    return items
+
+
+class TestExistingMaterials(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(
+            material, "get_material_directory", return_value=self.temp_dir.name
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def touch(self, name: str, content: bytes = b"data") -> str:
+        file_path = f"{self.temp_dir.name}/{name}"
+        with open(file_path, "wb") as f:
+            f.write(content)
+        return file_path
+
+    def test_list_existing_materials(self):
+        video_path = self.touch("vid-a.mp4")
+        image_path = self.touch("img-b.jpg")
+        self.touch("vid-c.mp4.part")
+        self.touch("vid-d.mp4", b"")
+        self.touch("vid-e.txt")
+        os.mkdir(f"{self.temp_dir.name}/vid-f.mp4")
+
+        self.assertEqual(
+            material.list_existing_materials(self.temp_dir.name),
+            {"vid-a": video_path, "img-b": image_path},
+        )
+
+    def test_download_videos_skips_existing(self):
+        items = video_items(2)
+        existing_path = self.touch(material.material_id(items[0].url) + ".mp4")
+
+        with mock.patch.object(material, "search_videos_pexels", return_value=items), \
+                mock.patch.object(material, "save_material", return_value="new.mp4") as save:
+            video_paths = material.download_videos(
+                "task",
+                ["money"],
+                video_contact_mode=VideoConcatMode.sequential,
+                audio_duration=12,
+            )
+
+        self.assertEqual(video_paths, [existing_path, "new.mp4"])
+        save.assert_called_once()
+        self.assertEqual(save.call_args.kwargs["material_url"], items[1].url)
+
+    def test_download_images_skips_existing(self):
+        items = video_items(2)
+        for item in items:
+            item.type = MaterialType.image
+        existing_path = self.touch(material.material_id(items[0].url, MaterialType.image) + ".png")
+
+        with mock.patch.object(material, "search_images_pexels", return_value=items), \
+                mock.patch.object(material, "save_material", return_value="new.jpg") as save:
+            image_paths = material.download_images("task", ["money"], image_count=2)
+
+        self.assertEqual(sorted(image_paths), sorted([existing_path, "new.jpg"]))
+        save.assert_called_once()
+        self.assertEqual(save.call_args.kwargs["material_url"], items[1].url)
+
+
+class TestDownloadVideos(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.items = video_items(20)
+        self.failed_urls = set()
+        for target, kwargs in [
+            ("get_material_directory", {"return_value": self.temp_dir.name}),
+            ("search_videos_pexels", {"return_value": self.items}),
+            ("save_material", {"side_effect": self.save_material}),
+        ]:
+            patcher = mock.patch.object(material, target, **kwargs)
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def save_material(self, material_url: str, save_dir: str, material_type: MaterialType) -> str:
+        if material_url in self.failed_urls:
+            return ""
+        return f"saved:{material_url}"
+
+    def download(self) -> list:
+        return material.download_videos(
+            "task",
+            ["money"],
+            video_contact_mode=VideoConcatMode.sequential,
+            audio_duration=12,
+            max_clip_duration=5,
+        )
+
+    def test_only_needed_videos_downloaded(self):
+        video_paths = self.download()
+
+        # 12 seconds need 3 clips of 5 seconds, plus the spare ones of the batch
+        self.assertEqual(video_paths, [f"saved:{item.url}" for item in self.items[:3]])
+        self.assertEqual(self.save_material.call_count, 3 + material._SPARE_VIDEO_COUNT)
+
+    def test_next_batch_after_failures(self):
+        self.failed_urls = {item.url for item in self.items[:5]}
+
+        video_paths = self.download()
+
+        self.assertEqual(video_paths, [f"saved:{item.url}" for item in self.items[5:8]])
+        self.assertEqual(self.save_material.call_count, 11)
+
+    def test_async_download(self):
+        video_paths = asyncio.run(
+            material_async.adownload_videos(
+                "task",
+                ["money"],
+                video_contact_mode=VideoConcatMode.sequential,
+                audio_duration=12,
+                max_clip_duration=5,
+            )
+        )
+
+        self.assertEqual(video_paths, self.download())
+
+
+def image_bytes(image_format: str, **kwargs) -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (8, 8), (200, 30, 30)).save(output, format=image_format, **kwargs)
+    return output.getvalue()
+
+
+class TestSaveImage(unittest.TestCase):
+    url = "https://images.pexels.com/photos/1/photo.jpeg?auto=compress"
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def save(self, data: bytes) -> str:
+        def fake_download(url, file_path, **kwargs):
+            with open(file_path, "wb") as f:
+                f.write(data)
+
+        with mock.patch.object(material, "_download_file", side_effect=fake_download):
+            return material.save_image(self.url, self.temp_dir.name)
+
+    def read(self, file_path: str) -> bytes:
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def assertNoPartFile(self):
+        names = os.listdir(self.temp_dir.name)
+        self.assertFalse([name for name in names if name.endswith(".part")])
+
+    def test_png_kept_as_png(self):
+        data = image_bytes("PNG")
+        image_path = self.save(data)
+        self.assertTrue(image_path.endswith(".png"))
+        self.assertEqual(self.read(image_path), data)
+        self.assertNoPartFile()
+
+    def test_jpeg_kept_byte_for_byte(self):
+        data = image_bytes("JPEG", quality=95)
+        image_path = self.save(data)
+        self.assertTrue(image_path.endswith(".jpg"))
+        self.assertEqual(self.read(image_path), data)
+
+    def test_mpo_kept_byte_for_byte(self):
+        second = Image.new("RGB", (8, 8), (30, 200, 30))
+        data = image_bytes("MPO", save_all=True, append_images=[second])
+        with Image.open(io.BytesIO(data)) as img:
+            self.assertEqual(img.format, "MPO")
+
+        image_path = self.save(data)
+        self.assertTrue(image_path.endswith(".jpg"))
+        self.assertEqual(self.read(image_path), data)
+
+    def test_other_formats_converted_to_jpg(self):
+        for image_format in ["WEBP", "GIF"]:
+            with self.subTest(image_format=image_format):
+                data = image_bytes(image_format)
+                image_path = self.save(data)
+                self.assertTrue(image_path.endswith(".jpg"))
+                with Image.open(image_path) as img:
+                    self.assertEqual(img.format, "JPEG")
+                self.assertNoPartFile()
+                os.remove(image_path)
+
+    def test_invalid_image(self):
+        self.assertEqual(self.save(b"<html>not an image</html>"), "")
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()